@@ -28,26 +28,88 @@ Configuration Setup (REQUIRED for --email flag):
    - Use the 16-digit password in settings.env
 
 Dependencies:
-pip install requests markdown python-dotenv rich
+pip install requests markdown python-dotenv rich orjson
 """
+import functools
+import hashlib
+import heapq
+import io
+import itertools
 import json
 import sys
+import time
 import argparse
+import contextlib
+import importlib.util
+import inspect
 import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import markdown  # For markdown-to-HTML conversion
-from dotenv import load_dotenv
+import orjson  # Fast JSON parsing/serialization
 import requests
+import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError, Timeout, RequestException
-from rich.console import Console
-console = Console(width=90)
-from rich.markdown import Markdown
+from urllib3.util.retry import Retry
+# markdown, rich, smtplib, email.mime and dotenv are imported inside the
+# functions that use them, so quick runs like --check-server start fast.
+if TYPE_CHECKING:
+    from email.mime.multipart import MIMEMultipart
+
+# Digest instructions sent ahead of the browsing log. Keep this text byte-identical
+# across runs (no dates/timestamps) so llama.cpp can reuse the cached prompt prefix.
+DIGEST_INSTRUCTIONS = """Below is a log of web pages I visited. Create a 2-minute reading digest that:
+1. **Main Themes**: What topics did I spend time on today? (2-3 bullet points)
+2. **Key Insights**: What are the most important things I learned? (3-5 bullet points)
+3. **Action Items**: Any tasks, ideas, or follow-ups worth noting? (if applicable)
+4. **Time Analysis**: Brief observation about my browsing patterns
+Keep it conversational and useful. Skip the fluff."""
+
+# Above this many candidate pages, get_top_pages shortlists with NumPy (if installed)
+LARGE_HISTORY_PAGES = 1000
+
+# Footer appended to every saved/emailed digest
+DIGEST_FOOTER = "*Generated locally using llama.cpp server. No data left your machine.*\n"
+
+# Minimal markdown escaping for link titles (single str.translate pass)
+_MD_ESCAPE = str.maketrans({
+    '[': '\\[',
+    ']': '\\]',
+    '(': '\\(',
+    ')': '\\)',
+    '<': '&lt;',
+    '>': '&gt;',
+})
+# Characters not allowed in generated filenames (replaced with "-")
+_BAD_CHARS = re.compile(r"[^A-Za-z0-9_-]")
+
+# Lazily created singletons (see _console / _markdown_converter)
+_CONSOLE = None
+_MD = None
+
+# Shared HTTP session: keep-alive connection pool reused for every llama.cpp call
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=2,
+    pool_maxsize=4,
+    max_retries=Retry(total=2, backoff_factor=0.3)
+))
+SESSION.headers.update({"Connection": "keep-alive"})
+
+# On-disk cache of generated digests (see cache_digest)
+DEFAULT_CACHE_DIR = "~/.cache/browsing-digest"
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+def _console():
+    """Shared rich console, created on first use."""
+    global _CONSOLE
+    if _CONSOLE is None:
+        from rich.console import Console
+        _CONSOLE = Console(width=90)
+    return _CONSOLE
 
 def load_config(config_path: str = None) -> str:
     """
@@ -60,6 +122,8 @@ def load_config(config_path: str = None) -> str:
     Returns:
         Path to successfully loaded config file, or None if none found
     """
+    from dotenv import load_dotenv
+
     script_dir = Path(__file__).parent.resolve()
     
     # Priority 1: Explicit config path from CLI
@@ -86,42 +150,54 @@ def load_config(config_path: str = None) -> str:
     
     return None
 
-def normalize_json_keys(obj: Any) -> Any:
+def _normalize(obj: Any) -> Tuple[Any, bool]:
     """
-    Recursively normalize JSON keys and string values by stripping whitespace.
-    Fixes common export issues where keys/values contain trailing spaces like:
-    "date ": "2026-02-06 "  →  "date": "2026-02-06"
+    Recursively strip whitespace from JSON keys and string values in one pass.
+    Containers are only rebuilt when something inside them actually changed,
+    so already-clean data is returned as-is.
     Args:
         obj: JSON object (dict, list, str, or primitive)
     Returns:
-        Normalized object with cleaned keys/values
+        (normalized object, True if anything was repaired)
     """
     if isinstance(obj, dict):
-        return {
-            key.strip(): normalize_json_keys(value)
-            for key, value in obj.items()
-            if key.strip()  # Skip empty keys after stripping
-        }
+        repaired = False
+        items = []
+        for key, value in obj.items():
+            clean_key = key.strip()
+            clean_value, value_repaired = _normalize(value)
+            if clean_key != key or value_repaired:
+                repaired = True
+            if clean_key:  # Skip empty keys after stripping
+                items.append((clean_key, clean_value))
+            else:
+                repaired = True
+        return (dict(items), True) if repaired else (obj, False)
     elif isinstance(obj, list):
-        return [normalize_json_keys(item) for item in obj]
+        repaired = False
+        items = []
+        for item in obj:
+            clean_item, item_repaired = _normalize(item)
+            repaired = repaired or item_repaired
+            items.append(clean_item)
+        return (items, True) if repaired else (obj, False)
     elif isinstance(obj, str):
-        return obj.strip()
+        stripped = obj.strip()
+        return stripped, stripped != obj
     else:
-        return obj
+        return obj, False
 
-def _collect_keys(obj: Any, keys: set = None) -> set:
-    """Helper to collect all keys from nested JSON structures."""
-    if keys is None:
-        keys = set()
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            if isinstance(k, str):
-                keys.add(k)
-            _collect_keys(v, keys)
-    elif isinstance(obj, list):
-        for item in obj:
-            _collect_keys(item, keys)
-    return keys
+def normalize_json_keys(obj: Any) -> Any:
+    """
+    Recursively normalize JSON keys and string values by stripping whitespace.
+    Fixes common export issues where keys/values contain trailing spaces like:
+    "date ": "2026-02-06 "  →  "date": "2026-02-06"
+    Args:
+        obj: JSON object (dict, list, str, or primitive)
+    Returns:
+        Normalized object with cleaned keys/values
+    """
+    return _normalize(obj)[0]
 
 def check_llama_cpp_server(server_url: str = "http://localhost:8080/v1") -> bool:
     """
@@ -134,12 +210,12 @@ def check_llama_cpp_server(server_url: str = "http://localhost:8080/v1") -> bool
     try:
         # Try health check endpoint first (llama.cpp specific)
         health_url = f"{server_url.rstrip('/').replace('/v1', '')}/health"
-        response = requests.get(health_url, timeout=3)
+        response = SESSION.get(health_url, timeout=3)
         if response.status_code == 200:
             return True
         # Fallback to models endpoint (OpenAI-compatible)
         models_url = f"{server_url.rstrip('/')}/models"
-        response = requests.get(models_url, timeout=3)
+        response = SESSION.get(models_url, timeout=3)
         return response.status_code == 200
     except (ConnectionError, Timeout, RequestException):
         return False
@@ -150,10 +226,14 @@ def call_llama_cpp_api(
     server_url: str = "http://localhost:8080/v1",
     temperature: float = 0.7,
     max_tokens: int = 1500,
-    timeout: int = 120
+    timeout: int = 120,
+    on_token: Optional[Callable[[str], None]] = None,
+    cache_prompt: bool = True
 ) -> str:
     """
     Call llama.cpp server via OpenAI-compatible API.
+    The response is streamed (server-sent events) so tokens can be shown
+    as soon as they are generated instead of after the whole reply.
     Args:
         prompt: User prompt to send to the model
         model: Model identifier (usually "local-model" for llama.cpp)
@@ -161,6 +241,8 @@ def call_llama_cpp_api(
         temperature: Sampling temperature (0.0-2.0)
         max_tokens: Maximum tokens to generate
         timeout: Request timeout in seconds
+        on_token: Optional callback invoked with each streamed text chunk
+        cache_prompt: Let llama.cpp reuse the KV cache for the shared prompt prefix
     Returns:
         Model's response text
     Raises:
@@ -183,27 +265,57 @@ def call_llama_cpp_api(
         ],
         "temperature": temperature,
         "max_tokens": max_tokens,
-        "stream": False
+        "stream": True,
+        # llama.cpp extensions: reuse KV state of the longest common prompt prefix
+        # from the previous request on the same slot (skips re-evaluating it)
+        "cache_prompt": cache_prompt,
+        "id_slot": 0
     }
+    if temperature == 0:
+        # Greedy decoding: let llama.cpp take the argmax instead of building
+        # and sorting the full sampling distribution for every token
+        payload.update({"top_k": 1, "top_p": 1.0, "min_p": 0.0})
     try:
-        response = requests.post(
+        response = SESSION.post(
             api_endpoint,
             json=payload,
             timeout=timeout,
+            stream=True,
             headers={"Content-Type": "application/json"}
         )
         # Handle HTTP errors
-        if response.status_code != 200:
-            error_detail = response.json().get("error", {}).get("message", response.text)
+        if not response.ok:
+            # Read and parse the (non-streamed) error body once; fall back to raw text
+            body = response.content
+            try:
+                error = orjson.loads(body).get("error", {})
+                error_detail = error.get("message") if isinstance(error, dict) else error
+            except (orjson.JSONDecodeError, AttributeError):
+                error_detail = None
+            if not error_detail:
+                error_detail = body[:200].decode('utf-8', 'replace')
             raise RuntimeError(
-                f"API error {response.status_code}: {error_detail[:200]}"
+                f"API error {response.status_code}: {str(error_detail)[:200]}"
             )
-        # Parse successful response
-        result = response.json()
-        if "choices" not in result or not result["choices"]:
-            raise RuntimeError("Unexpected API response format: missing 'choices'")
-        message = result["choices"][0].get("message", {})
-        content = message.get("content", "").strip()
+        # Parse streamed response ("data: {...}" lines, terminated by "data: [DONE]").
+        # Work on raw bytes: the server sends text/event-stream without a charset,
+        # so requests would decode it as Latin-1; orjson decodes the UTF-8 itself.
+        content_parts = []
+        with response:
+            for line in response.iter_lines():
+                if not line or not line.startswith(b"data: "):
+                    continue
+                if line == b"data: [DONE]":
+                    break
+                chunk = orjson.loads(line[6:])
+                if not chunk.get("choices"):
+                    continue
+                token = chunk["choices"][0].get("delta", {}).get("content") or ""
+                if token:
+                    content_parts.append(token)
+                    if on_token:
+                        on_token(token)
+        content = "".join(content_parts).strip()
         if not content:
             raise RuntimeError("Received empty response from model")
         return content
@@ -218,17 +330,11 @@ def call_llama_cpp_api(
     except json.JSONDecodeError as e:
         raise RuntimeError(f"Invalid JSON response from API: {e}")
 
-def load_browsing_data(filepath: str) -> dict:
+def _read_browsing_data(filepath: str) -> Tuple[dict, bool]:
     """
-    Load and repair browsing data from JSON file.
-    Automatically fixes common export issues:
-    - Keys with trailing/leading spaces ("date " → "date")
-    - Values with trailing spaces ("2026-02-06 " → "2026-02-06")
-    - Preserves backup of original file if repairs were needed
-    Args:
-        filepath: Path to JSON file
+    Read, normalize and validate browsing data without touching the file.
     Returns:
-        Normalized browsing data dictionary
+        (normalized data, True if whitespace repairs were needed)
     Raises:
         FileNotFoundError: If file doesn't exist
         ValueError: If file isn't valid JSON or lacks required structure
@@ -239,29 +345,24 @@ def load_browsing_data(filepath: str) -> dict:
     if not path.suffix.lower() == '.json':
         raise ValueError(f"Expected JSON file, got: {path.suffix}")
     # Load raw JSON content
+    raw = path.read_bytes()
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            raw_content = f.read()
-        data = json.loads(raw_content)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON format: {e}")
-    # Check if repair is needed (detect whitespace in keys)
-    needs_repair = any(
-        isinstance(k, str) and (k.startswith(' ') or k.endswith(' '))
-        for k in _collect_keys(data)
-    )
-    if needs_repair:
-        print(f"⚠️  Malformed JSON detected - repairing keys/values...")
-        original_backup = path.with_suffix('.json.bak')
-        shutil.copy2(path, original_backup)
-        print(f"   Original saved as: {original_backup.name}")
-        # Repair the data structure
-        repaired_data = normalize_json_keys(data)
-        # Save repaired version
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(repaired_data, f, indent=2, ensure_ascii=False)
-        print(f"   Repaired JSON saved to: {path.name}")
-        data = repaired_data
+        data = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        # orjson rejects lone surrogate escapes (e.g. an emoji cut in half by
+        # the extension's 5000-char truncation); the stdlib parser accepts them.
+        # Swap them for U+FFFD so the text can be UTF-8 encoded downstream.
+        try:
+            data = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON format: {e}")
+        data = json.loads(
+            json.dumps(data, ensure_ascii=False)
+            .encode('utf-16', 'surrogatepass')
+            .decode('utf-16', 'replace')
+        )
+    # Detect and repair whitespace in keys/values in a single pass
+    data, needs_repair = _normalize(data)
     # Validate required structure
     required_keys = {'date', 'pages'}
     actual_keys = set(data.keys())
@@ -272,23 +373,166 @@ def load_browsing_data(filepath: str) -> dict:
             f"Found keys: {actual_keys}. "
             "This may indicate a severely malformed export file."
         )
+    return data, needs_repair
+
+def _save_repaired_data(
+    filepath: str,
+    repaired_data: dict,
+    repair_in_place: bool = True,
+    backup: bool = True
+):
+    """
+    Report a repair and, if requested, write the repaired JSON over the file.
+    The repaired file is written to a temp file and atomically renamed over
+    the original, so an interrupted run never leaves a half-written export.
+    """
+    print(f"⚠️  Malformed JSON detected - repairing keys/values...")
+    if not repair_in_place:
+        return
+    path = Path(filepath)
+    tmp_path = path.with_suffix('.json.tmp')
+    try:
+        if backup:
+            original_backup = path.with_suffix('.json.bak')
+            shutil.copy2(path, original_backup)
+            print(f"   Original saved as: {original_backup.name}")
+        # Save repaired version: write temp file, then atomic rename
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(repaired_data, option=orjson.OPT_INDENT_2))
+            f.flush()
+            os.fsync(f.fileno())  # Data on disk before the rename
+        shutil.copymode(path, tmp_path)  # Keep the export's permissions (private history)
+        os.replace(tmp_path, path)
+        print(f"   Repaired JSON saved to: {path.name}")
+    except OSError as e:
+        # Read-only file/directory or network mount: keep the repair in memory
+        tmp_path.unlink(missing_ok=True)
+        print(f"   ⚠️  Could not rewrite {path.name} ({e}); using repaired data in memory")
+
+def load_browsing_data(
+    filepath: str,
+    repair_in_place: bool = True,
+    backup: bool = True
+) -> dict:
+    """
+    Load and repair browsing data from JSON file.
+    Automatically fixes common export issues:
+    - Keys with trailing/leading spaces ("date " → "date")
+    - Values with trailing spaces ("2026-02-06 " → "2026-02-06")
+    - Preserves backup of original file if repairs were needed
+    The repaired file is written to a temp file and atomically renamed over
+    the original, so an interrupted run never leaves a half-written export.
+    Args:
+        filepath: Path to JSON file
+        repair_in_place: Rewrite the file with the repaired JSON
+            (the repaired data is returned either way)
+        backup: Keep a copy of the original as *.json.bak before rewriting
+    Returns:
+        Normalized browsing data dictionary
+    Raises:
+        FileNotFoundError: If file doesn't exist
+        ValueError: If file isn't valid JSON or lacks required structure
+    """
+    data, needs_repair = _read_browsing_data(filepath)
+    if needs_repair:
+        _save_repaired_data(filepath, data, repair_in_place=repair_in_place, backup=backup)
     return data
 
-def prepare_content_for_llm(data: dict, max_tokens: int = 4000) -> str:  # FIXED: parameter name corrected
-    """Prepare browsing content for LLM summarization."""
-    pages = data.get('pages', [])
+def count_tokens_per_text(texts: List[str], server_url: str) -> Optional[List[int]]:
+    """
+    Count tokens for several texts with ONE call to the llama.cpp /tokenize endpoint.
+    The texts are tokenized concatenated (with_pieces=True) and each token is
+    assigned to the text its first byte falls in, using the pieces' byte lengths.
+    Args:
+        texts: Texts to measure, in order
+        server_url: Base URL of the llama.cpp server API
+    Returns:
+        Token count per text, or None if the server can't tokenize with pieces
+    """
+    tokenize_url = f"{server_url.rstrip('/').replace('/v1', '')}/tokenize"
+    try:
+        response = SESSION.post(
+            tokenize_url,
+            json={"content": "".join(texts), "with_pieces": True},
+            timeout=30
+        )
+        if response.status_code != 200:
+            return None
+        tokens = response.json()["tokens"]
+        # Byte offset where each text ends in the concatenated UTF-8 string
+        ends = list(itertools.accumulate(len(t.encode('utf-8')) for t in texts))
+        counts = [0] * len(texts)
+        offset = 0
+        i = 0
+        for token in tokens:
+            piece = token["piece"]  # str, or list of byte values for partial UTF-8
+            while i < len(ends) - 1 and offset >= ends[i]:
+                i += 1
+            counts[i] += 1
+            offset += len(piece.encode('utf-8')) if isinstance(piece, str) else len(piece)
+        return counts
+    except (RequestException, ValueError, KeyError, TypeError):
+        return None
+
+def _is_top_candidate(page: dict) -> bool:
+    """True if the page has a valid URL and meaningful engagement (see get_top_pages)."""
+    url = page.get('url')
+    return bool(
+        url
+        and url.strip().startswith('http')  # Valid URL
+        and (page.get('readingTime', 0) > 0.5 or len(page.get('content', '')) > 100)  # Meaningful engagement
+    )
+
+def _preprocess(data: dict) -> Tuple[List[dict], float, List[dict]]:
+    """
+    Walk the pages once and derive everything main needs from them.
+    Returns:
+        (pages sorted by timestamp, total reading time in minutes,
+         pages eligible for the top pages section)
+    """
+    sorted_pages = []
+    top_candidates = []
+    total_reading_time = 0
+    for page in data.get('pages', []):
+        total_reading_time += page.get('readingTime', 0)
+        sorted_pages.append(page)
+        if _is_top_candidate(page):
+            top_candidates.append(page)
+    sorted_pages.sort(key=lambda x: x.get('timestamp', ''))
+    return sorted_pages, total_reading_time, top_candidates
+
+def prepare_content_for_llm(
+    data: dict,
+    max_tokens: int = 4000,
+    sorted_pages: Optional[List[dict]] = None,
+    server_url: Optional[str] = None
+) -> str:  # FIXED: parameter name corrected
+    """
+    Prepare browsing content for LLM summarization.
+    Pass sorted_pages (already sorted by timestamp, see _preprocess) to skip re-sorting.
+    With server_url, pages are measured with the model's own tokenizer (one
+    /tokenize call for all candidate pages) so the budget is exact; otherwise
+    (or if tokenizing fails) a chars/4 estimate is used.
+    """
+    if sorted_pages is not None:
+        pages = sorted_pages
+    else:
+        # Sort by timestamp
+        pages = sorted(data.get('pages', []), key=lambda x: x.get('timestamp', ''))
     if not pages:
         return ""
-    # Sort by timestamp
-    pages = sorted(pages, key=lambda x: x.get('timestamp', ''))
-    # Build content string with budget
-    content_parts = []
-    estimated_tokens = 0
-    tokens_per_char = 0.25  # Rough estimate
+    # Format candidate pages, stopping once there is clearly more text than
+    # the budget can hold (no tokenizer packs 16+ chars per token on average)
+    page_texts = []
+    candidate_chars = 0
     for page in pages:
+        if candidate_chars > max_tokens * 16:
+            break
         title = page.get('title', 'Untitled')
         domain = page.get('domain', 'Unknown')
         content = page.get('content', '')[:1000]  # Limit per-page content
+        if not content.strip():
+            continue  # No content: only wastes budget
         timestamp = page.get('timestamp', '')
         # Format time
         try:
@@ -296,96 +540,274 @@ def prepare_content_for_llm(data: dict, max_tokens: int = 4000) -> str:  # FIXED
             time_str = dt.strftime('%H:%M')
         except (ValueError, AttributeError):
             time_str = 'Unknown time'
-        page_text = f"""
----
-[{time_str}] {title}
-Source: {domain}
-Content: {content}
-"""
-        page_tokens = len(page_text) * tokens_per_char
-        if estimated_tokens + page_tokens > max_tokens:
+        page_text = f"---\n[{time_str}] {title}\nSource: {domain}\nContent: {content}\n\n"
+        page_texts.append(page_text)
+        candidate_chars += len(page_text)
+    if not page_texts:
+        return ""
+    page_tokens = count_tokens_per_text(page_texts, server_url) if server_url else None
+    if page_tokens is None:
+        tokens_per_char = 0.25  # Rough estimate (fallback only)
+        page_tokens = [len(text) * tokens_per_char for text in page_texts]
+    # Build content in a single buffer: prefix sum of page sizes up to the budget
+    buf = io.StringIO()
+    used_tokens = 0
+    for page_text, tokens in zip(page_texts, page_tokens):
+        if used_tokens + tokens > max_tokens:
             break
-        content_parts.append(page_text)
-        estimated_tokens += page_tokens
-    return "\n".join(content_parts)
+        buf.write(page_text)
+        used_tokens += tokens
+    return buf.getvalue()
+
+def _embed_text(text: str, server_url: str) -> Optional[List[float]]:
+    """
+    Get an embedding for text from the llama.cpp server (OpenAI-compatible /embeddings).
+    Requires the server to be started with --embeddings.
+    Returns:
+        Embedding vector, or None if the server can't provide one
+    """
+    try:
+        response = SESSION.post(
+            f"{server_url.rstrip('/')}/embeddings",
+            json={"input": text},
+            timeout=30
+        )
+        if response.status_code != 200:
+            return None
+        return response.json()["data"][0]["embedding"]
+    except (RequestException, ValueError, KeyError, IndexError):
+        return None
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    """Cosine similarity of two equal-length vectors."""
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = sum(x * x for x in a) ** 0.5
+    norm_b = sum(y * y for y in b) ** 0.5
+    if not norm_a or not norm_b:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+def _load_cache_index(index_file: Path) -> List[Dict]:
+    """Load the semantic cache index (list of {"key", "model", "settings", "embedding"}), empty if unreadable."""
+    try:
+        return orjson.loads(index_file.read_bytes())
+    except (OSError, json.JSONDecodeError):
+        return []
+
+def cache_digest(func: Callable[..., str]) -> Callable[..., str]:
+    """
+    Cache generated digests on disk so re-runs on the same browsing log skip the LLM.
+    Digests are stored as {cache_dir}/{sha256(model|date|settings|instructions|content)}.md,
+    where settings are all other arguments of the wrapped function (defaults
+    applied) except cache_prompt, which only affects speed.
+    With semantic_cache=True a miss falls back to the closest cached digest whose
+    log embedding has cosine similarity >= SEMANTIC_CACHE_THRESHOLD and that was
+    generated with the same model and settings.
+    Adds keyword arguments to the wrapped function:
+        use_cache: Set False to always call the model
+        cache_dir: Directory holding cached digests
+        semantic_cache: Also match near-duplicate logs via embeddings
+    """
+    signature = inspect.signature(func)
 
+    @functools.wraps(func)
+    def wrapper(
+        *args,
+        use_cache: bool = True,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        semantic_cache: bool = False,
+        **kwargs
+    ) -> str:
+        if not use_cache:
+            return func(*args, **kwargs)
+        cache_path = Path(cache_dir).expanduser()
+        # Normalize positional/keyword/default arguments so equal settings
+        # always give the same key
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop("cache_prompt", None)
+        content = arguments.pop("content")
+        model = arguments.pop("model")
+        date = arguments.pop("date")
+        server_url = arguments["server_url"]
+        settings = dict(sorted(arguments.items()))
+        key = hashlib.sha256(
+            f"{model}|{date}|{settings}|{DIGEST_INSTRUCTIONS}|{content}".encode("utf-8")
+        ).hexdigest()
+        digest_file = cache_path / f"{key}.md"
+        if digest_file.exists():
+            print(f"   ♻️  Using cached digest: {digest_file.name}")
+            return digest_file.read_text(encoding="utf-8")
+        index_file = cache_path / "index.json"
+        embedding = None
+        if semantic_cache:
+            embedding = _embed_text(content[:2000], server_url)
+            if embedding:
+                index = _load_cache_index(index_file)
+                best_score, best_key = 0.0, None
+                for entry in index:
+                    # Only reuse digests made by the same model with the same settings
+                    if entry.get("model") != model or entry.get("settings") != settings:
+                        continue
+                    score = _cosine(embedding, entry["embedding"])
+                    if score > best_score:
+                        best_score, best_key = score, entry["key"]
+                similar_file = cache_path / f"{best_key}.md"
+                if best_score >= SEMANTIC_CACHE_THRESHOLD and similar_file.exists():
+                    print(f"   ♻️  Using similar cached digest ({best_score:.3f}): {similar_file.name}")
+                    return similar_file.read_text(encoding="utf-8")
+        digest = func(*args, **kwargs)
+        try:
+            cache_path.mkdir(parents=True, exist_ok=True)
+            digest_file.write_text(digest, encoding="utf-8")
+            if embedding:
+                index = _load_cache_index(index_file)
+                index.append({
+                    "key": key,
+                    "model": model,
+                    "settings": settings,
+                    "embedding": embedding
+                })
+                index_file.write_bytes(orjson.dumps(index))
+        except OSError as e:
+            print(f"   ⚠️  Could not write digest cache: {e}")
+        return digest
+    return wrapper
+
+@cache_digest
 def generate_summary(
     content: str,
     model: str,
     date: str,
-    server_url: str
+    server_url: str,
+    cache_prompt: bool = True,
+    temperature: float = 0.0,
+    max_tokens: int = 700
 ) -> str:
-    """Generate a summary using llama.cpp server via OpenAI-compatible API."""
-    prompt = f"""Below is a log of web pages I visited on {date}. Create a 2-minute reading digest that:
-1. **Main Themes**: What topics did I spend time on today? (2-3 bullet points)
-2. **Key Insights**: What are the most important things I learned? (3-5 bullet points)
-3. **Action Items**: Any tasks, ideas, or follow-ups worth noting? (if applicable)
-4. **Time Analysis**: Brief observation about my browsing patterns
-Keep it conversational and useful. Skip the fluff.
+    """
+    Generate a summary using llama.cpp server via OpenAI-compatible API.
+    Defaults to greedy decoding (temperature 0) for a deterministic digest.
+    """
+    # Invariant instructions first, volatile data (date + log) last: llama.cpp
+    # can only reuse the KV cache for the longest common prefix between runs.
+    prompt = f"""{DIGEST_INSTRUCTIONS}
 ---
-BROWSING LOG:
+BROWSING LOG ({date}):
 {content}
 ---
 Now write my digest:"""
-    return call_llama_cpp_api(
-        prompt=prompt,
-        model=model,
-        server_url=server_url,
-        temperature=0.6,
-        max_tokens=1200,
-        timeout=180  # 3 minutes for larger contexts
-    )
+    # Render tokens live as they stream in from the server. rich parses the
+    # markdown when the renderable is built, so rebuild it at most once per
+    # refresh interval instead of on every token.
+    streamed = []
+    refresh_per_second = 8
+    last_render = 0.0
+    from rich.live import Live
+    from rich.markdown import Markdown
+
+    with Live(Markdown(""), console=_console(), refresh_per_second=refresh_per_second, transient=True) as live:
+        def show_token(token: str):
+            nonlocal last_render
+            streamed.append(token)
+            now = time.monotonic()
+            if now - last_render >= 1 / refresh_per_second:
+                last_render = now
+                live.update(Markdown("".join(streamed)))
+        return call_llama_cpp_api(
+            prompt=prompt,
+            model=model,
+            server_url=server_url,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=180,  # 3 minutes for larger contexts
+            on_token=show_token,
+            cache_prompt=cache_prompt
+        )
 
-def get_top_pages(data: dict, top_n: int = 15) -> List[Dict]:  # FIXED: parameter name corrected
+def _rank_unique(pages: Iterable[dict], top_n: int) -> List[Dict]:
     """
-    Extract top pages sorted by reading time (descending), with content length as fallback.
-    Filters out pages with negligible engagement (< 30 seconds).
+    Score pages by (readingTime, content length), keep the best page per
+    domain + title and return the top_n of them, best first.
     """
-    pages = data.get('pages', [])
-    # Filter valid pages with URLs and meaningful engagement
-    valid_pages = [
-        p for p in pages 
-        if p.get('url') 
-        and p.get('url').strip().startswith('http')  # Valid URL
-        and (p.get('readingTime', 0) > 0.5 or len(p.get('content', '')) > 100)  # Meaningful engagement
-    ]
-    
-    if not valid_pages:
-        return []
-    
-    # Sort primarily by readingTime, secondarily by content length
-    sorted_pages = sorted(
-        valid_pages,
-        key=lambda p: (
-            p.get('readingTime', 0), 
-            len(p.get('content', ''))
-        ),
-        reverse=True
-    )
-    
-    # Deduplicate by domain + title to avoid repetitive entries
-    seen = set()
-    unique_pages = []
-    for page in sorted_pages:
+    # Single pass: score and deduplicate by domain + title,
+    # keeping the best-scoring page per key
+    best = {}
+    for idx, page in enumerate(pages):
+        reading_time = page.get('readingTime', 0)
+        content_len = len(page.get('content', ''))
         title = page.get('title', '').strip().lower()[:50]  # First 50 chars for uniqueness
         domain = page.get('domain', '').strip().lower()
         key = f"{domain}:{title}"
-        if key not in seen:
-            seen.add(key)
-            unique_pages.append(page)
-            if len(unique_pages) >= top_n:
-                break
+        # -idx: on equal scores the earlier page wins, like a stable sort
+        score = (reading_time, content_len, -idx)
+        if key not in best or best[key][0] < score:
+            best[key] = (score, page)
     
-    return unique_pages[:top_n]
+    # Rank primarily by readingTime, secondarily by content length,
+    # then by original position
+    top = heapq.nlargest(top_n, best.values(), key=lambda entry: entry[0])
+    return [page for _, page in top]
 
-def append_top_pages_section(digest: str, data: dict, top_n: int = 15) -> str:  # FIXED: parameter name corrected
+def _shortlist_by_reading_time(pages: List[dict], top_n: int) -> Optional[List[dict]]:
+    """
+    Cut a large page list down to the pages that can still make the top_n,
+    using a NumPy O(N) partition on reading time.
+    Keeps every page whose reading time is >= the (4 * top_n)-th largest one,
+    in original order, so ranking the shortlist gives the same result as
+    ranking everything as long as it still yields top_n unique pages.
+    Returns:
+        The shortlist, or None if NumPy isn't installed or nothing can be cut
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    k = top_n * 4  # Headroom for pages dropped as duplicates
+    if top_n <= 0 or k >= len(pages):
+        return None
+    reading_times = np.fromiter(
+        (p.get('readingTime', 0) for p in pages), dtype=np.float64, count=len(pages)
+    )
+    threshold = np.partition(reading_times, len(pages) - k)[len(pages) - k]
+    keep = reading_times >= threshold
+    return [page for page, kept in zip(pages, keep.tolist()) if kept]
+
+def get_top_pages(
+    data: dict,
+    top_n: int = 15,
+    candidates: Optional[List[dict]] = None
+) -> List[Dict]:  # FIXED: parameter name corrected
+    """
+    Extract top pages sorted by reading time (descending), with content length as fallback.
+    Filters out pages with negligible engagement (< 30 seconds).
+    Pass candidates (pages already filtered, see _preprocess) to skip the filter.
+    Large histories (> LARGE_HISTORY_PAGES) are shortlisted with NumPy first when available.
+    """
+    if candidates is None:
+        candidates = [p for p in data.get('pages', []) if _is_top_candidate(p)]
+    if len(candidates) > LARGE_HISTORY_PAGES:
+        shortlist = _shortlist_by_reading_time(candidates, top_n)
+        if shortlist is not None:
+            top_pages = _rank_unique(shortlist, top_n)
+            if len(top_pages) == top_n:
+                return top_pages
+            # Too many duplicates in the shortlist: rank everything
+    return _rank_unique(candidates, top_n)
+
+def append_top_pages_section(
+    digest: str,
+    data: dict,
+    top_n: int = 15,
+    candidates: Optional[List[dict]] = None
+) -> Tuple[str, int]:  # FIXED: parameter name corrected
     """
     Append a "Top Pages Visited" section to the digest with clickable links.
-    Returns the enhanced digest content.
+    Returns the enhanced digest content and the number of pages listed.
     """
-    top_pages = get_top_pages(data, top_n)
+    top_pages = get_top_pages(data, top_n, candidates=candidates)
     if not top_pages:
-        return digest
+        return digest, 0
     
     # Build links section
     links_section = "\n## 🔗 Top Pages Visited\n\n"
@@ -397,14 +819,7 @@ def append_top_pages_section(digest: str, data: dict, top_n: int = 15) -> str:
         reading_time = page.get('readingTime', 0)
         
         # Minimal markdown escaping for safety
-        safe_title = (title
-            .replace('[', '\\[')
-            .replace(']', '\\]')
-            .replace('(', '\\(')
-            .replace(')', '\\)')
-            .replace('<', '&lt;')
-            .replace('>', '&gt;')
-        )
+        safe_title = title.translate(_MD_ESCAPE)
         
         # Format with emoji indicators based on time spent
         if reading_time >= 5:
@@ -417,20 +832,15 @@ def append_top_pages_section(digest: str, data: dict, top_n: int = 15) -> str:
         links_section += f"{i}. {indicator} [{safe_title}]({url}) — **{reading_time:.1f} min**\n"
     
     links_section += "\n---\n"
-    return digest + links_section
+    return digest + links_section, len(top_pages)
 
-def convert_markdown_to_html(markdown_text: str) -> str:
-    """Convert markdown to styled HTML for email."""
-    html_body = markdown.markdown(
-        markdown_text,
-        extensions=['extra', 'codehilite', 'tables', 'toc']
-    )
-    return f"""
+# Email HTML wrapper around the converted digest (plain strings, no formatting needed)
+_HTML_HEAD = """
     <html>
     <head>
         <meta charset="UTF-8">
         <style>
-            body {{ 
+            body { 
                 font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Oxygen, Ubuntu, Cantarell, 'Open Sans', 'Helvetica Neue', sans-serif;
                 line-height: 1.6; 
                 color: #333; 
@@ -438,74 +848,75 @@ def convert_markdown_to_html(markdown_text: str) -> str:
                 margin: 20px auto; 
                 padding: 20px; 
                 background-color: #f9f9f9;
-            }}
-            .container {{ 
+            }
+            .container { 
                 background-color: white; 
                 border-radius: 10px; 
                 padding: 30px; 
                 box-shadow: 0 2px 10px rgba(0,0,0,0.05);
-            }}
-            h1, h2, h3 {{ color: #2c3e50; margin-top: 1.5em; }}
-            h1 {{ border-bottom: 2px solid #eee; padding-bottom: 10px; }}
-            a {{ color: #3498db; text-decoration: none; }}
-            a:hover {{ text-decoration: underline; }}
-            code {{ 
+            }
+            h1, h2, h3 { color: #2c3e50; margin-top: 1.5em; }
+            h1 { border-bottom: 2px solid #eee; padding-bottom: 10px; }
+            a { color: #3498db; text-decoration: none; }
+            a:hover { text-decoration: underline; }
+            code { 
                 background-color: #f5f5f5; 
                 padding: 2px 4px; 
                 border-radius: 4px; 
                 font-family: monospace; 
                 font-size: 0.95em;
-            }}
-            pre {{ 
+            }
+            pre { 
                 background-color: #2d2d2d; 
                 color: #f8f8f2; 
                 padding: 15px; 
                 border-radius: 5px; 
                 overflow-x: auto; 
                 font-family: monospace;
-            }}
-            blockquote {{ 
+            }
+            blockquote { 
                 border-left: 4px solid #4a90e2; 
                 padding-left: 15px; 
                 color: #555; 
                 margin: 20px 0; 
                 font-style: italic;
-            }}
-            table {{ 
+            }
+            table { 
                 border-collapse: collapse; 
                 width: 100%; 
                 margin: 20px 0; 
                 font-size: 0.95em;
-            }}
-            th, td {{ 
+            }
+            th, td { 
                 border: 1px solid #ddd; 
                 padding: 10px; 
                 text-align: left; 
-            }}
-            th {{ 
+            }
+            th { 
                 background-color: #f2f2f2; 
                 font-weight: 600;
-            }}
-            ul, ol {{ padding-left: 20px; }}
-            li {{ margin-bottom: 8px; }}
-            .footer {{ 
+            }
+            ul, ol { padding-left: 20px; }
+            li { margin-bottom: 8px; }
+            .footer { 
                 margin-top: 30px; 
                 padding-top: 20px; 
                 border-top: 1px solid #eee; 
                 color: #777; 
                 font-size: 0.9em;
-            }}
-            .time-indicator {{ 
+            }
+            .time-indicator { 
                 display: inline-block; 
                 width: 1.5em; 
                 text-align: center; 
                 margin-right: 0.5em;
-            }}
+            }
         </style>
     </head>
     <body>
         <div class="container">
-            {html_body}
+            """
+_HTML_TAIL = """
             <div class="footer">
                 <p>📧 Sent automatically from your local browsing digest generator</p>
                 <p>🔒 100% private – processed entirely on your machine with llama.cpp</p>
@@ -515,22 +926,29 @@ def convert_markdown_to_html(markdown_text: str) -> str:
     </html>
     """
 
-def send_markdown_email(
+def _markdown_converter():
+    """Markdown converter reused for every email (reset() between documents)."""
+    global _MD
+    if _MD is None:
+        import markdown  # For markdown-to-HTML conversion
+        _MD = markdown.Markdown(extensions=['extra', 'codehilite', 'tables', 'toc'])
+    return _MD
+
+def convert_markdown_to_html(markdown_text: str) -> str:
+    """Convert markdown to styled HTML for email."""
+    html_body = _markdown_converter().reset().convert(markdown_text)
+    return _HTML_HEAD + html_body + _HTML_TAIL
+
+def _build_email_message(
     sender_email: str,
-    sender_password: str,
     receiver_email: str,
     subject: str,
-    markdown_content: str,
-    smtp_server: str = "smtp.gmail.com",
-    smtp_port: int = 587
-) -> bool:
-    """
-    Sends a beautifully formatted email using Markdown + HTML.
-    Uses Gmail app passwords with STARTTLS on port 587.
-    
-    Returns:
-        True if email sent successfully, False otherwise
-    """
+    markdown_content: str
+) -> "MIMEMultipart":
+    """Build a multipart (plain markdown + styled HTML) email message."""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
     # Convert Markdown to HTML with styling
     html_content = convert_markdown_to_html(markdown_content)
     
@@ -545,15 +963,65 @@ def send_markdown_email(
     part2 = MIMEText(html_content, "html")      # Pretty version
     msg.attach(part1)
     msg.attach(part2)
+    return msg
 
+@contextlib.contextmanager
+def _smtp_session(
+    sender_email: str,
+    sender_password: str,
+    smtp_server: str,
+    smtp_port: int
+):
+    """
+    Open an authenticated SMTP session (STARTTLS) and always close it on exit.
+    On success the session ends with QUIT; after any error the socket is just
+    closed, so a dead/timed-out connection doesn't block on another QUIT.
+    send_message uses PIPELINING automatically when the server advertises it.
+    """
+    import smtplib
+    import ssl
+
+    # Gmail requires STARTTLS on port 587 (not SSL on 465)
+    server = smtplib.SMTP(smtp_server, smtp_port, timeout=30)
     try:
-        # Gmail requires STARTTLS on port 587 (not SSL on 465)
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()  # Upgrade connection to secure TLS
+        server.ehlo()
+        server.starttls(context=ssl.create_default_context())  # Upgrade connection to secure TLS
+        server.ehlo()  # Re-identify over TLS to get the real extension list
         server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        print("✅ Email sent successfully!")
+        yield server
+    except BaseException:
+        server.close()
+        raise
+    else:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+def send_markdown_emails(
+    sender_email: str,
+    sender_password: str,
+    messages: List[Tuple[str, str, str]],
+    smtp_server: str = "smtp.gmail.com",
+    smtp_port: int = 587
+) -> bool:
+    """
+    Send several markdown emails over a single SMTP session.
+    Args:
+        messages: List of (receiver_email, subject, markdown_content)
+    Returns:
+        True if all emails were sent successfully, False otherwise
+    """
+    import smtplib
+
+    try:
+        with _smtp_session(sender_email, sender_password, smtp_server, smtp_port) as server:
+            for receiver_email, subject, markdown_content in messages:
+                server.send_message(_build_email_message(
+                    sender_email, receiver_email, subject, markdown_content
+                ))
+        print("✅ Email sent successfully!" if len(messages) == 1
+              else f"✅ {len(messages)} emails sent successfully!")
         return True
     except smtplib.SMTPAuthenticationError as e:
         print(f"❌ Authentication failed. Check your app password:")
@@ -565,19 +1033,54 @@ def send_markdown_email(
         print(f"❌ Failed to send email: {type(e).__name__}: {e}")
         return False
 
-def save_digest(digest: str, output_path: str, date: str, stats: dict):
-    """Save the digest to a markdown file."""
-    full_content = f"""# 📚 Browsing Digest - {date}
-**Generated**: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-**Pages analyzed**: {stats['total_pages']}
-**Estimated reading time**: {stats['total_reading_time']} minutes
----
-{digest}
----
-*Generated locally using llama.cpp server. No data left your machine.*
-"""
+def send_markdown_email(
+    sender_email: str,
+    sender_password: str,
+    receiver_email: str,
+    subject: str,
+    markdown_content: str,
+    smtp_server: str = "smtp.gmail.com",
+    smtp_port: int = 587
+) -> bool:
+    """
+    Sends a beautifully formatted email using Markdown + HTML.
+    Uses Gmail app passwords with STARTTLS on port 587.
+    
+    Returns:
+        True if email sent successfully, False otherwise
+    """
+    return send_markdown_emails(
+        sender_email,
+        sender_password,
+        [(receiver_email, subject, markdown_content)],
+        smtp_server=smtp_server,
+        smtp_port=smtp_port
+    )
+
+def _compose_full(digest: str, date: str, stats: dict) -> str:
+    """Wrap the digest with its header (date + stats) and footer."""
+    return "".join((
+        f"# 📚 Browsing Digest - {date}\n",
+        f"**Generated**: {datetime.now().strftime('%Y-%m-%d %H:%M')}\n",
+        f"**Pages analyzed**: {stats['total_pages']}\n",
+        f"**Estimated reading time**: {stats['total_reading_time']} minutes\n",
+        "\n---\n\n",
+        digest,
+        "\n\n---\n\n",
+        DIGEST_FOOTER,
+    ))
+
+def save_digest(digest: str, output_path: str, date: str, stats: dict) -> str:
+    """
+    Save the digest to a markdown file.
+    Returns the full file content (header + digest + footer) so it can be reused.
+    """
+    full_content = _compose_full(digest, date, stats)
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write(full_content)
+        f.flush()
+        os.fsync(f.fileno())  # Make sure the digest is on disk before emailing/exiting
+    return full_content
 
 def main():
     parser = argparse.ArgumentParser(
@@ -637,6 +1140,45 @@ Email Requirements (for --email flag):
         action="store_true",
         help="Check server status and exit"
     )
+    parser.add_argument(
+        "--temperature",
+        type=float,
+        default=0.0,
+        help="Sampling temperature (default: 0.0, greedy and deterministic)"
+    )
+    parser.add_argument(
+        "--max-tokens",
+        type=int,
+        default=700,
+        help="Maximum tokens to generate for the digest (default: 700)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable llama.cpp prompt caching and the on-disk digest cache "
+             "(useful for benchmarking)"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory for cached digests (default: {DEFAULT_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Reuse the cached digest of a near-identical browsing log "
+             "(requires llama.cpp server started with --embeddings)"
+    )
+    parser.add_argument(
+        "--no-repair-in-place",
+        action="store_true",
+        help="Repair malformed JSON in memory only, leave the input file untouched"
+    )
+    parser.add_argument(
+        "--no-backup",
+        action="store_true",
+        help="Don't keep a .json.bak copy when repairing the input file"
+    )
     parser.add_argument(
         "--top-pages", "-t",
         type=int,
@@ -665,7 +1207,7 @@ Email Requirements (for --email flag):
             print("✅ Server is running and responsive")
             # Try to get model info
             try:
-                resp = requests.get(f"{args.server.rstrip('/')}/models", timeout=5)
+                resp = SESSION.get(f"{args.server.rstrip('/')}/models", timeout=5)
                 if resp.status_code == 200:
                     models = resp.json().get("data", [])
                     if models:
@@ -682,22 +1224,34 @@ Email Requirements (for --email flag):
     if not args.input_file:
         parser.error("the following arguments are required: input_file")
 
-    # Check server availability
+    # Check server availability and read data concurrently
+    # (independent: network round-trip overlaps with file read + parse).
+    # The file itself is only rewritten once the server check has passed.
     print(f"🔍 Checking llama.cpp server at {args.server}...")
-    if not check_llama_cpp_server(args.server):
-        print("❌ llama.cpp server is not running!")
-        print(f"   Start it with: ./server -c 4096 --port 8080")
-        print("   Or download from: https://github.com/ggerganov/llama.cpp")
-        sys.exit(1)
-    print("✅ Server is running")
-
-    # Load and repair data
     print(f"📂 Loading {args.input_file}...")
-    try:
-        data = load_browsing_data(args.input_file)
-    except (FileNotFoundError, ValueError) as e:
-        print(f"❌ Error loading file: {e}")
-        sys.exit(1)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        server_future = executor.submit(check_llama_cpp_server, args.server)
+        data_future = executor.submit(_read_browsing_data, args.input_file)
+
+        if not server_future.result():
+            print("❌ llama.cpp server is not running!")
+            print(f"   Start it with: ./server -c 4096 --port 8080")
+            print("   Or download from: https://github.com/ggerganov/llama.cpp")
+            sys.exit(1)
+        print("✅ Server is running")
+
+        try:
+            data, needs_repair = data_future.result()
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ Error loading file: {e}")
+            sys.exit(1)
+    if needs_repair:
+        _save_repaired_data(
+            args.input_file,
+            data,
+            repair_in_place=not args.no_repair_in_place,
+            backup=not args.no_backup
+        )
 
     # Check if there's data
     pages = data.get('pages', [])
@@ -707,12 +1261,14 @@ Email Requirements (for --email flag):
 
     date = data.get('date', 'Unknown date')
     total_pages = data.get('totalPages', len(pages))
-    total_reading_time = sum(p.get('readingTime', 0) for p in pages)
+    sorted_pages, total_reading_time, top_candidates = _preprocess(data)
     print(f"📊 Found {total_pages} pages ({total_reading_time} min reading time)")
 
     # Prepare content
     print("📝 Preparing content for summarization...")
-    content = prepare_content_for_llm(data)  # Now works correctly with 'data' parameter
+    content = prepare_content_for_llm(
+        data, sorted_pages=sorted_pages, server_url=args.server
+    )
     if not content:
         print("❌ No content to summarize")
         sys.exit(1)
@@ -721,27 +1277,37 @@ Email Requirements (for --email flag):
     print(f"🤖 Generating digest with {args.model} via {args.server}...")
     print("   (This may take 30-90 seconds depending on context size)")
     try:
-        digest = generate_summary(content, args.model, date, args.server)
+        digest = generate_summary(
+            content, args.model, date, args.server,
+            cache_prompt=not args.no_cache,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            semantic_cache=args.semantic_cache
+        )
     except RuntimeError as e:
         print(f"❌ Error generating summary: {e}")
         sys.exit(1)
 
     # ===== APPEND TOP PAGES SECTION =====
     print(f"🔗 Appending top {args.top_pages} pages visited...")
-    digest = append_top_pages_section(digest, data, top_n=args.top_pages)  # Correct parameter name
-    print(f"   Added {len(get_top_pages(data, args.top_pages))} unique pages to digest")
+    digest, n_top = append_top_pages_section(
+        digest, data, top_n=args.top_pages, candidates=top_candidates
+    )
+    print(f"   Added {n_top} unique pages to digest")
 
     # Determine output path
     if args.output:
         output_path = args.output
     else:
         # Sanitize date for filename (remove invalid characters)
-        safe_date = "".join(c if c.isalnum() or c in "-_" else "-" for c in str(date))
+        safe_date = _BAD_CHARS.sub("-", str(date))
         output_path = f"digest-{safe_date}.md"
 
     # Save digest to file
     print(f"💾 Saving to {output_path}...")
-    save_digest(
+    full_content = save_digest(
         digest,
         output_path,
         date,
@@ -769,22 +1335,6 @@ Email Requirements (for --email flag):
             print("\n   🔑 Generate app password at: https://myaccount.google.com/apppasswords")
             sys.exit(1)
         
-        # Prepare email content (full digest with header/footer)
-        email_content = f"""# 📚 Daily Browsing Digest - {date}
-
-**Generated**: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-**Pages analyzed**: {total_pages}
-**Total reading time**: {total_reading_time} minutes
-
----
-
-{digest}
-
----
-
-🔒 *This digest was generated 100% locally on your machine using llama.cpp. No data was sent to external servers.*
-"""
-        
         subject = f"Daily Browsing Digest - {date}"
         
         # Send email
@@ -793,7 +1343,7 @@ Email Requirements (for --email flag):
             sender_password=sender_password,
             receiver_email=receiver_email,
             subject=subject,
-            markdown_content=email_content,
+            markdown_content=full_content,  # Same header/footer as the saved file
             smtp_server="smtp.gmail.com",
             smtp_port=587
         )
@@ -808,7 +1358,8 @@ Email Requirements (for --email flag):
     print("=" * 50)
     preview = digest[:600] + "..." if len(digest) > 600 else digest
     # Ensure preview prints correctly on Windows
-    console.print(Markdown(preview.encode('utf-8', errors='replace').decode('utf-8', errors='replace')))
+    from rich.markdown import Markdown
+    _console().print(Markdown(preview.encode('utf-8', errors='replace').decode('utf-8', errors='replace')))
 
 if __name__ == "__main__":
     # Check for required dependencies
@@ -818,14 +1369,11 @@ if __name__ == "__main__":
     except ImportError:
         missing_deps.append("requests")
     
-    try:
-        import markdown
-    except ImportError:
+    # Lazily imported modules: only check they're installed, don't import them
+    if importlib.util.find_spec("markdown") is None:
         missing_deps.append("markdown")
     
-    try:
-        from dotenv import load_dotenv
-    except ImportError:
+    if importlib.util.find_spec("dotenv") is None:
         print("❌ Missing required dependency: python-dotenv")
         print("   Install with: pip install python-dotenv")
         sys.exit(1)
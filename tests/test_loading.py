@@ -0,0 +1,42 @@
+"""Tests for reading browsing exports in load_browsing_data."""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dailyBrowsing_llamaCPP as digest_app
+
+# The extension truncates content with substring(0, 5000), which can cut an
+# emoji in half and leave a lone surrogate escape in the export
+EXPORT = (
+    b'{"date ": "2026-02-08", "pages": [{"title": "Plans \\ud83d\\udcc5",'
+    b' "content": "hello \\ud83d... [truncated]"}]}'
+)
+
+
+class LoadBrowsingDataTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "browsing.json"
+        self.path.write_bytes(EXPORT)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_lone_surrogate_is_replaced(self):
+        data = digest_app.load_browsing_data(str(self.path))
+        page = data["pages"][0]
+        self.assertEqual(page["title"], "Plans 📅")
+        self.assertEqual(page["content"], "hello �... [truncated]")
+        page["content"].encode("utf-8")
+
+    def test_repaired_file_is_rewritten(self):
+        data = digest_app.load_browsing_data(str(self.path))
+        self.assertEqual(digest_app.load_browsing_data(str(self.path)), data)
+        self.assertTrue(self.path.with_suffix(".json.bak").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
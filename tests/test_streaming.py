@@ -0,0 +1,63 @@
+"""Tests for streamed chat completions in call_llama_cpp_api."""
+import json
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dailyBrowsing_llamaCPP as digest_app
+
+# Multibyte tokens: "é"/"—" are garbled by a Latin-1 decode, and
+# "📅" (F0 9F 93 85) / "Å" (C3 85) contain byte 0x85, which Latin-1 turns
+# into NEL, a line break for str.splitlines()
+TOKENS = ["Café — Today", " 📅", " Å", " ok"]
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    """Minimal llama.cpp-like server streaming TOKENS as server-sent events."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b"".join(
+            b"data: " + json.dumps(
+                {"choices": [{"delta": {"content": token}}]}, ensure_ascii=False
+            ).encode("utf-8") + b"\n\n"
+            for token in TOKENS
+        ) + b"data: [DONE]\n\n"
+        self.send_response(200)
+        # Like llama.cpp: no charset parameter
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StreamingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.server_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_multibyte_tokens_are_decoded_as_utf8(self):
+        received = []
+        result = digest_app.call_llama_cpp_api(
+            "hi", server_url=self.server_url, on_token=received.append
+        )
+        self.assertEqual(result, "".join(TOKENS))
+        self.assertEqual(received, TOKENS)
+
+
+if __name__ == "__main__":
+    unittest.main()